@@ -1,4 +1,7 @@
-if "bpy" in locals():
+import os
+
+# only reload the submodules when reloading scripts during add-on development
+if "bpy" in locals() and os.environ.get("DARTS_DEV"):
     import importlib
     if "scene" in locals():
         importlib.reload(scene)
@@ -18,11 +21,13 @@ import bpy_extras
 from bpy.props import BoolProperty, IntProperty, StringProperty, EnumProperty
 from bpy_extras.io_utils import ExportHelper
 
+from . import scene
+
 bl_info = {
     "name": "Darts",
     "author": "Wojciech Jarosz, Baptiste Nicolet, Shaojie Jiao, Adrien Gruson, Delio Vicini, Tizian Zeltner",
     "version": (0, 2, 9),
-    "blender": (2, 80, 0),
+    "blender": (3, 3, 0),
     "location": "File > Export > Darts exporter (.json)",
     "description": "Export Darts scene format (.json)",
     "warning": "",
@@ -32,6 +37,28 @@ bl_info = {
     'warning': 'alpha'}
 
 
+def print_report(type, message):
+    print(f"{', '.join(sorted(type))}: {message}")
+
+
+def export_scene_darts(context, filepath, report=print_report, **options):
+    """
+    Export the scene to filepath without going through the operator (e.g. from batch scripts).
+
+    Any export options not specified are set to the defaults of the Darts export operator.
+    """
+    keywords = {prop.identifier: prop.default
+                for prop in DartsExporter.bl_rna.properties
+                if prop.identifier not in {"rna_type", "filepath", "check_existing", "filter_glob"}}
+    keywords.update(options)
+
+    converter = scene.SceneWriter(context,
+                                  report,
+                                  filepath=filepath,
+                                  **keywords)
+    converter.write()
+
+
 class DartsExporter(bpy.types.Operator, ExportHelper):
     """Export as a Darts scene"""
     bl_idname = "export_scene.darts"
@@ -60,6 +87,11 @@ class DartsExporter(bpy.types.Operator, ExportHelper):
         description="Uncheck this to write out the Darts scene file, but not write out any OBJs to disk",
         default=True,
     )
+    reuse_obj_cache: BoolProperty(
+        name="Reuse unchanged OBJs",
+        description="Skip writing OBJ files whose geometry (transforms, vertices, faces, smoothing and sharp edges, UVs and material assignments) has not changed since the last export. Only applies to meshes without modifiers, shape keys or custom normals. Edits to the materials themselves are not detected",
+        default=False,
+    )
 
     # Scene-wide settings
     integrator: EnumProperty(
@@ -103,6 +135,16 @@ class DartsExporter(bpy.types.Operator, ExportHelper):
         ),
         default="SINGLE",
     )
+    eval_mode: EnumProperty(
+        name="Modifiers",
+        items=(
+            ('DAG_EVAL_RENDER', "Render",
+             "Apply modifiers using their render settings, matching what Blender renders"),
+            ('DAG_EVAL_VIEWPORT', "Viewport",
+             "Apply modifiers using their viewport settings (faster, but may differ from the rendered geometry)"),
+        ),
+        default="DAG_EVAL_RENDER",
+    )
 
     # Material-related settings
     material_mode: EnumProperty(
@@ -227,15 +269,10 @@ class DartsExporter(bpy.types.Operator, ExportHelper):
     )
 
     def execute(self, context):
-        from . import scene
-
         keywords = self.as_keywords(ignore=("check_existing",
                                             "filter_glob"
                                             ))
-        converter = scene.SceneWriter(context,
-                                      self.report,
-                                      **keywords)
-        converter.write()
+        export_scene_darts(context, report=self.report, **keywords)
 
         return {'FINISHED'}
 
@@ -243,18 +280,22 @@ class DartsExporter(bpy.types.Operator, ExportHelper):
         pass
 
 
-class DARTS_PT_export_include(bpy.types.Panel):
+class DartsPanelMixin:
+    """Common settings for the panels of the Darts export operator's file browser"""
     bl_space_type = 'FILE_BROWSER'
     bl_region_type = 'TOOL_PROPS'
-    bl_label = "Include"
     bl_parent_id = "FILE_PT_operator"
 
+    operator_id = "EXPORT_SCENE_OT_darts"
+
     @classmethod
     def poll(cls, context):
-        sfile = context.space_data
-        operator = sfile.active_operator
+        operator = context.space_data.active_operator
+        return operator is not None and operator.bl_idname == cls.operator_id
 
-        return operator.bl_idname == "EXPORT_SCENE_OT_darts"
+
+class DARTS_PT_export_include(DartsPanelMixin, bpy.types.Panel):
+    bl_label = "Include"
 
     def draw(self, context):
         layout = self.layout
@@ -271,18 +312,8 @@ class DARTS_PT_export_include(bpy.types.Panel):
         sublayout.prop(operator, "use_visibility")
 
 
-class DARTS_PT_export_scene(bpy.types.Panel):
-    bl_space_type = 'FILE_BROWSER'
-    bl_region_type = 'TOOL_PROPS'
+class DARTS_PT_export_scene(DartsPanelMixin, bpy.types.Panel):
     bl_label = "Scene"
-    bl_parent_id = "FILE_PT_operator"
-
-    @classmethod
-    def poll(cls, context):
-        sfile = context.space_data
-        operator = sfile.active_operator
-
-        return operator.bl_idname == "EXPORT_SCENE_OT_darts"
 
     def draw(self, context):
         layout = self.layout
@@ -297,18 +328,8 @@ class DARTS_PT_export_scene(bpy.types.Panel):
         layout.prop(operator, 'use_lights')
 
 
-class DARTS_PT_export_geometry(bpy.types.Panel):
-    bl_space_type = 'FILE_BROWSER'
-    bl_region_type = 'TOOL_PROPS'
+class DARTS_PT_export_geometry(DartsPanelMixin, bpy.types.Panel):
     bl_label = "Geometry"
-    bl_parent_id = "FILE_PT_operator"
-
-    @classmethod
-    def poll(cls, context):
-        sfile = context.space_data
-        operator = sfile.active_operator
-
-        return operator.bl_idname == "EXPORT_SCENE_OT_darts"
 
     def draw(self, context):
         layout = self.layout
@@ -319,21 +340,13 @@ class DARTS_PT_export_geometry(bpy.types.Panel):
         operator = sfile.active_operator
 
         layout.prop(operator, 'mesh_mode')
+        layout.prop(operator, 'eval_mode')
         layout.prop(operator, "write_obj_files")
+        layout.prop(operator, "reuse_obj_cache")
 
 
-class DARTS_PT_export_materials(bpy.types.Panel):
-    bl_space_type = 'FILE_BROWSER'
-    bl_region_type = 'TOOL_PROPS'
+class DARTS_PT_export_materials(DartsPanelMixin, bpy.types.Panel):
     bl_label = "Material conversion"
-    bl_parent_id = "FILE_PT_operator"
-
-    @classmethod
-    def poll(cls, context):
-        sfile = context.space_data
-        operator = sfile.active_operator
-
-        return operator.bl_idname == "EXPORT_SCENE_OT_darts"
 
     def draw(self, context):
         layout = self.layout
@@ -353,20 +366,10 @@ class DARTS_PT_export_materials(bpy.types.Panel):
         sublayout.prop(operator, 'glossy_mode')
 
 
-class DARTS_PT_export_textures(bpy.types.Panel):
-    bl_space_type = 'FILE_BROWSER'
-    bl_region_type = 'TOOL_PROPS'
+class DARTS_PT_export_textures(DartsPanelMixin, bpy.types.Panel):
     bl_label = "Texture conversion"
-    bl_parent_id = "FILE_PT_operator"
     bl_options = {'DEFAULT_CLOSED'}
 
-    @classmethod
-    def poll(cls, context):
-        sfile = context.space_data
-        operator = sfile.active_operator
-
-        return operator.bl_idname == "EXPORT_SCENE_OT_darts"
-
     def draw(self, context):
         layout = self.layout
         layout.use_property_split = True
@@ -1,22 +1,18 @@
 from mathutils import Matrix
-from mathutils import Vector
 from math import degrees, atan, tan
 
 
 def export(ctx, b_scene):
 
     # only exporting one camera
-    cameras = [cam for cam in ctx.context.scene.objects
-               if cam.type in {'CAMERA'}]
+    b_camera = ctx.context.scene.camera
 
-    if len(cameras) == 0:
+    if b_camera is None:
         ctx.report({"WARNING"}, "No camera to export!")
-    elif len(cameras) > 1:
+    elif len(ctx.by_type['CAMERA']) > 1:
         ctx.report(
             {"WARNING"}, "Multiple cameras found, only exporting the active one.")
 
-    b_camera = ctx.context.scene.camera
-
     # default camera
     params = {}
 
@@ -35,16 +31,17 @@ def export(ctx, b_scene):
     percent = b_scene.render.resolution_percentage / 100.0
     params["resolution"] = [int(res_x * percent), int(res_y * percent)]
 
-    # up, lookat, and position
-    up = b_camera.matrix_world.to_quaternion() @ Vector((0.0, 1.0, 0.0))
-    direction = b_camera.matrix_world.to_quaternion() @ Vector((0.0, 0.0, -1.0))
-    loc = b_camera.matrix_world.to_translation()
+    # up, lookat, and position (read directly from the columns of the camera's world matrix)
+    to_world = b_camera.matrix_world
+    up = to_world.col[1].to_3d().normalized()
+    direction = -to_world.col[2].to_3d().normalized()
+    loc = to_world.to_translation()
 
     # set the values and return
     params["transform"] = {
-        "from": list(loc),
-        "up": list(up),
-        "at": list(loc + direction)
+        "from": loc[:],
+        "up": up[:],
+        "at": (loc + direction)[:]
     }
 
     if b_camera.data.dof.use_dof:
@@ -55,7 +52,7 @@ def export(ctx, b_scene):
 
         if b_camera.data.dof.focus_object is not None:
             # compute distance to object location projected along the camera view direction
-            params["fdist"] = abs(b_camera.matrix_world.col[2].to_3d().normalized().dot(
+            params["fdist"] = abs(direction.dot(
                 b_camera.data.dof.focus_object.matrix_world.to_translation() - loc))
         else:
             params["fdist"] = b_camera.data.dof.focus_distance
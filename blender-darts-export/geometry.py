@@ -1,9 +1,87 @@
 import os
+import contextlib
+import hashlib
+import numpy as np
 import bpy
 from mathutils import Matrix, Vector, Euler
 
 
-def write_obj(ctx, obj_name):
+def hash_array(h, collection, attr, count, dtype=np.float32):
+    '''Feed the values of attr for all items of a bpy collection into the hash h'''
+    values = np.empty(count, dtype=dtype)
+    collection.foreach_get(attr, values)
+    h.update(values.tobytes())
+
+
+def mesh_signature(ctx, meshes):
+    '''
+    Compute a hash of the geometry that would be written out for the given meshes.
+
+    This considers the object transforms, the mesh topology, vertex positions, smooth shading (including
+    auto smooth and sharp edges), UVs and material assignments, as well as the export settings that affect the OBJ file.
+
+    Returns None if the written geometry depends on anything we do not hash (modifiers, shape keys, custom normals,
+    or objects other than plain meshes), in which case the OBJ file should always be written.
+    '''
+    if any(mesh.type != 'MESH' or mesh.modifiers or mesh.data.shape_keys is not None or mesh.data.has_custom_normals
+           for mesh in meshes):
+        return None
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((ctx.eval_mode, ctx.material_mode != "OFF")).encode())
+    for mesh in meshes:
+        data = mesh.data
+        h.update(repr((mesh.name_full, data.name_full,
+                       tuple(tuple(row) for row in mesh.matrix_world),
+                       tuple((slot.link, slot.material.name_full if slot.material else None)
+                             for slot in mesh.material_slots),
+                       # auto smooth was replaced by a modifier in Blender 4.1
+                       getattr(data, 'use_auto_smooth', None), getattr(data, 'auto_smooth_angle', None),
+                       len(data.vertices), len(data.edges), len(data.polygons), len(data.loops),
+                       tuple(layer.name for layer in data.uv_layers))).encode())
+        hash_array(h, data.vertices, 'co', len(data.vertices) * 3)
+        hash_array(h, data.loops, 'vertex_index', len(data.loops), np.int32)
+        hash_array(h, data.polygons, 'loop_total', len(data.polygons), np.int32)
+        hash_array(h, data.polygons, 'material_index', len(data.polygons), np.int32)
+        hash_array(h, data.polygons, 'use_smooth', len(data.polygons), bool)
+        hash_array(h, data.edges, 'use_edge_sharp', len(data.edges), bool)
+        for layer in data.uv_layers:
+            hash_array(h, layer.data, 'uv', len(data.loops) * 2)
+    return h.hexdigest()
+
+
+def signature_path(ctx, relative_path):
+    return os.path.splitext(os.path.join(ctx.directory, relative_path))[0] + ".sig"
+
+
+def obj_is_cached(ctx, relative_path, sig):
+    '''Check whether the OBJ file at relative_path is up to date w.r.t. the signature stored next to it'''
+    if sig is None:
+        return False
+
+    obj_path = os.path.join(ctx.directory, relative_path)
+    sig_path = signature_path(ctx, relative_path)
+    if os.path.exists(obj_path) and os.path.exists(sig_path):
+        with open(sig_path, "r") as sig_file:
+            return sig_file.read() == sig
+    return False
+
+
+def update_signature(ctx, relative_path, sig):
+    '''
+    Store the signature of a freshly written OBJ file next to it.
+
+    If there is no signature (the geometry cannot be cached), remove any stale one left by an earlier export.
+    '''
+    sig_path = signature_path(ctx, relative_path)
+    if sig is not None:
+        with open(sig_path, "w") as sig_file:
+            sig_file.write(sig)
+    elif os.path.exists(sig_path):
+        os.remove(sig_path)
+
+
+def write_obj(ctx, meshes, obj_name):
     '''Export meshes to "meshes/" and then point to them in the scene file'''
 
     relative_path = os.path.join('meshes', obj_name + ".obj")
@@ -13,35 +91,31 @@ def write_obj(ctx, obj_name):
     if obj_id in ctx.already_exported.keys():
         ctx.report({'WARNING'}, f"Exporting OBJ file '{relative_path}' again!")
 
-    if ctx.write_obj_files:
-        if bpy.app.version >= (3, 3, 0):
-            # new, faster C++ OBJ exporter
-            ctx.info(f"  Writing '{relative_path}' using C++ exporter.")
-            bpy.ops.wm.obj_export(filepath=os.path.join(ctx.directory, relative_path),
-                                  export_selected_objects=True,
-                                  export_eval_mode='DAG_EVAL_RENDER',
-                                  apply_modifiers=True,
-                                  export_normals=True,
-                                  export_uv=True,
-                                  export_materials=ctx.material_mode != "OFF",
-                                  export_triangulated_mesh=True,
-                                  check_existing=False,
-                                  forward_axis='Y', up_axis='Z')
-        else:
-            # legacy python exporter
-            ctx.info(
-                f"  Writing '{relative_path}' using legacy Python exporter.")
-            bpy.ops.export_scene.obj(filepath=os.path.join(ctx.directory, relative_path),
-                                     use_selection=True,
-                                     use_mesh_modifiers=True,
-                                     use_normals=True,
-                                     use_uvs=True,
-                                     use_materials=ctx.material_mode != "OFF",
-                                     use_triangles=True,
-                                     use_edges=False,
-                                     use_smooth_groups=False,
-                                     check_existing=False,
-                                     axis_forward='Y', axis_up='Z')
+    sig = mesh_signature(ctx, meshes) if ctx.write_obj_files and ctx.reuse_obj_cache else None
+
+    if obj_is_cached(ctx, relative_path, sig):
+        ctx.info(f"  Skipping unchanged '{relative_path}'.")
+    elif ctx.write_obj_files:
+        assert bpy.app.version >= (3, 3, 0), "Exporting OBJ files requires Blender's C++ OBJ exporter (Blender >= 3.3)"
+
+        ctx.info(f"  Writing '{relative_path}'.")
+        bpy.ops.wm.obj_export(filepath=os.path.join(ctx.directory, relative_path),
+                              export_selected_objects=True,
+                              export_eval_mode=ctx.eval_mode,
+                              apply_modifiers=True,
+                              export_normals=True,
+                              export_uv=True,
+                              export_materials=ctx.material_mode != "OFF",
+                              export_triangulated_mesh=True,
+                              export_curves_as_nurbs=False,
+                              export_object_groups=False,
+                              export_material_groups=False,
+                              export_vertex_groups=False,
+                              export_smooth_groups=False,
+                              check_existing=False,
+                              forward_axis='Y', up_axis='Z')
+        # only record the signature once the OBJ file has actually been written
+        update_signature(ctx, relative_path, sig)
 
     obj_params = {
         "type": "mesh",
@@ -55,28 +129,147 @@ def write_obj(ctx, obj_name):
     return obj_params
 
 
-def write_meshes(ctx, meshes, obj_name):
+def instance_key(mesh):
+    '''
+    Key identifying objects that would be written out to identical OBJ files in local coordinates.
 
-    # first, save the selection, then select the single mesh we want to export
-    viewport_selection = ctx.context.selected_objects
-    bpy.ops.object.select_all(action='DESELECT')
+    Returns None if the object's geometry cannot be shared (e.g. because of modifiers or object-linked materials).
+    '''
+    if mesh.type != 'MESH' or mesh.modifiers or any(slot.link != 'DATA' for slot in mesh.material_slots):
+        return None
+    return f"mesh-{mesh.data.name_full}"
 
-    for mesh in meshes:
-        mesh.select_set(True)
 
-    obj_json = write_obj(ctx, obj_name)
+def save_selection(ctx):
+    '''Deselect (and return) the current viewport selection'''
 
-    # Now restore the previous selection
-    bpy.ops.object.select_all(action='DESELECT')
+    # deselect only what is selected instead of walking the whole scene with bpy.ops
+    viewport_selection = list(ctx.context.view_layer.objects.selected)
+    for ob in viewport_selection:
+        ob.select_set(False)
+    return viewport_selection
+
+
+def restore_selection(viewport_selection):
     for ob in viewport_selection:
         ob.select_set(True)
 
+
+def write_meshes(ctx, meshes, obj_name):
+    '''Export the given meshes to a single OBJ file. Assumes nothing else is selected'''
+
+    for mesh in meshes:
+        mesh.select_set(True)
+
+    obj_json = write_obj(ctx, meshes, obj_name)
+
+    for mesh in meshes:
+        mesh.select_set(False)
+
     return obj_json
 
 
+def hierarchy_depth(ob):
+    depth = 0
+    while ob.parent is not None:
+        ob = ob.parent
+        depth += 1
+    return depth
+
+
+@contextlib.contextmanager
+def identity_transforms(objects):
+    '''
+    Temporarily set the world transform of objects to the identity (turning off their constraints).
+
+    The view layer is only updated once when entering, and once when leaving, regardless of the number of objects.
+    '''
+    to_parent = {}
+    influences = {}
+    # handle parents before their children, so the children end up with an identity world transform
+    for ob in sorted(objects, key=hierarchy_depth):
+        to_parent[ob] = ob.matrix_basis.copy()
+
+        # save and turn off constraints
+        n = len(ob.constraints)
+        if n:
+            influences[ob] = np.empty(n, dtype=np.float32)
+            ob.constraints.foreach_get('influence', influences[ob])
+            ob.constraints.foreach_set(
+                'influence', np.zeros(n, dtype=np.float32))
+
+        ob.matrix_world.identity()
+
+    bpy.context.view_layer.update()
+
+    try:
+        yield
+    finally:
+        # restore the local transforms (which, unlike world transforms, does not depend on the order we restore parents)
+        for ob, basis in to_parent.items():
+            ob.matrix_basis = basis
+            if ob in influences:
+                ob.constraints.foreach_set('influence', influences[ob])
+
+        bpy.context.view_layer.update()
+
+
+def write_split_meshes(ctx, meshes):
+    '''Export each mesh to its own OBJ file in local coordinates, and return the surfaces pointing to them'''
+
+    # objects sharing the same mesh data can point to the same OBJ file,
+    # so figure out which objects actually need to be written out
+    keys = [instance_key(mesh) for mesh in meshes]
+    to_export = []
+    for mesh, key in zip(meshes, keys):
+        if key is None or key not in ctx.already_exported:
+            to_export.append(mesh)
+            if key is not None:
+                ctx.already_exported[key] = None
+
+    # write_obj by default exports meshes in world coordinates. To save in local coordinates we temporarily
+    # set the transform of all meshes to the identity
+    to_world = {mesh: mesh.matrix_world.copy() for mesh in meshes}
+
+    # modifiers (mirror, array offset, hook, ...) can depend on the transform of other objects relative to
+    # this one, so only objects without modifiers can have their transforms reset all at once. Empties have no
+    # geometry of their own, but often serve as such helper objects, so leave them alone during the batch too
+    batched = [mesh for mesh in to_export if not mesh.modifiers and mesh.type != 'EMPTY']
+    isolated = [mesh for mesh in to_export if mesh.modifiers or mesh.type == 'EMPTY']
+
+    exported = {}
+    with identity_transforms(batched):
+        for mesh in batched:
+            exported[mesh] = write_meshes(ctx, [mesh], mesh.name)
+
+    for mesh in isolated:
+        with identity_transforms([mesh]):
+            exported[mesh] = write_meshes(ctx, [mesh], mesh.name)
+
+    surfaces_json = []
+    for mesh, key in zip(meshes, keys):
+        if mesh in exported:
+            params = exported[mesh]
+            if key is not None:
+                ctx.already_exported[key] = dict(params)
+        else:
+            if ctx.verbose:
+                ctx.info(
+                    f"  Reusing OBJ file of mesh '{mesh.data.name_full}' for '{mesh.name}'.")
+            params = dict(ctx.already_exported[key])
+            params["name"] = mesh.name
+        params["transform"] = ctx.transform_matrix(to_world[mesh])
+        surfaces_json.append(params)
+
+    return surfaces_json
+
+
 def export(ctx, meshes):
-    if not os.path.exists(ctx.directory + "/meshes"):
-        os.makedirs(ctx.directory + "/meshes")
+    os.makedirs(os.path.join(ctx.directory, "meshes"), exist_ok=True)
+
+    # save the selection once for the whole batch, so we only need to toggle
+    # the selection state of the mesh(es) we are currently exporting
+    viewport_selection = save_selection(ctx)
 
     surfaces_json = []
     if ctx.mesh_mode == "SINGLE":
@@ -86,65 +279,9 @@ def export(ctx, meshes):
         surfaces_json.append(write_meshes(ctx, meshes, obj_name))
     else:
         ctx.info("Exporting each Blender object as a separate OBJ file.")
-        for mesh in meshes:
-            # # write_obj by default exports meshes in world coordinates
-            # # to save in local coordinates we temporarily transform all vertices by the inverse of matrix_world
-            # to_world = mesh.matrix_world.copy()
-            # to_local = to_world.inverted_safe()
-
-            # if mesh.type == "MESH":
-            #     verts_copy = [vert.co.copy() for vert in mesh.data.vertices]
-            #     for vert in mesh.data.vertices:
-            #         vert.co = to_local @ vert.co
-            # else:
-            #     mesh.matrix_world.identity()
-
-            # bpy.context.view_layer.update()
-
-            # params = write_meshes(ctx, [mesh], mesh.name)
-            # params["transform"] = ctx.transform_matrix(to_world)
-
-            # if mesh.type == "MESH":
-            #     for i, vert in enumerate(mesh.data.vertices):
-            #         vert.co = verts_copy[i]
-            # else:
-            #     mesh.matrix_world = to_world
-
-            # bpy.context.view_layer.update()
-
-            # write_obj by default exports meshes in world coordinates
-            # to save in local coordinates we temporarily transform all vertices by the inverse of matrix_world
-            to_world = mesh.matrix_world.copy()
-            # location = mesh.location.copy()
-            # rotation = mesh.rotation_euler.copy()
-            # scale = mesh.scale.copy()
-
-            # save and turn off constraints
-            influences = []
-            # for i in range(len(mesh.constraints)):
-            for i, c in enumerate(mesh.constraints):
-                influences.append(c.influence)
-                c.influence = 0.0
-
-            mesh.matrix_world.identity()
-            # mesh.location.zero()
-            # mesh.rotation_euler.zero()
-            # mesh.scale = Vector.Fill(3, 1.0)
-
-            bpy.context.view_layer.update()
-
-            params = write_meshes(ctx, [mesh], mesh.name)
-            params["transform"] = ctx.transform_matrix(to_world)
-
-            mesh.matrix_world = to_world
-            # mesh.location = location
-            # mesh.rotation_euler = rotation
-            # mesh.scale = scale
-            for i, c in enumerate(mesh.constraints):
-                c.influence = influences[i]
-
-            bpy.context.view_layer.update()
-
-            surfaces_json.append(params)
+        surfaces_json = write_split_meshes(ctx, meshes)
+
+    # Now restore the previous selection
+    restore_selection(viewport_selection)
 
     return surfaces_json
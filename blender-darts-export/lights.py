@@ -1,11 +1,15 @@
 from mathutils import Matrix
 import numpy as np
 
+# Blender's area lights emit along -z, Darts' along +z
+FLIP_NORMAL = Matrix(
+    ((1, 0, 0, 0), (0, 1, 0, 0), (0, 0, -1, 0), (0, 0, 0, 1))).freeze()
 
-def convert_area_light(ctx, b_light):
+
+def convert_area_light(ctx, b_light, power):
     params = {}
 
-    scale_mat = Matrix.Scale(1, 4)
+    to_world = b_light.matrix_world
 
     # Compute area
     if b_light.data.shape == 'SQUARE' or b_light.data.shape == 'RECTANGLE':
@@ -27,70 +31,73 @@ def convert_area_light(ctx, b_light):
         area = np.pi * x*y * b_light.scale.x * b_light.scale.y / 4.0
         params['radius'] = x / 2.0
 
-        scale = Matrix()
-        scale[0][0] = 1
-        scale[1][1] = y / x
-        scale_mat = scale @ scale_mat
+        to_world = to_world @ Matrix.Diagonal((1, y / x, 1, 1))
     else:
         raise NotImplementedError(
             f"Light shape: {b_light.data.shape} is not supported")
 
     # object transform
-    flip_normal = Matrix(
-        ((1, 0, 0, 0), (0, 1, 0, 0), (0, 0, -1, 0), (0, 0, 0, 1)))
-    params['transform'] = ctx.transform_matrix(
-        b_light.matrix_world @ scale_mat @ flip_normal)
+    params['transform'] = ctx.transform_matrix(to_world @ FLIP_NORMAL)
 
     # Conversion factor used in Cycles, to convert to irradiance (don't ask me why)
     conv_fac = 1.0 / (area * 4.0)
     params['material'] = {
         'type': 'diffuse_light',
-        'emit': ctx.color(conv_fac * b_light.data.energy * b_light.data.color)
+        'emit': ctx.color((conv_fac * power).tolist())
     }
 
     return params
 
 
-def convert_point_light(ctx, b_light):
+def convert_point_light(ctx, b_light, power):
     params = {'type': 'point light'}
     params['radius'] = b_light.data.shadow_soft_size
     params['transform'] = {'translate': list(b_light.location)}
-    params['power'] = ctx.color(b_light.data.energy * b_light.data.color)
+    params['power'] = ctx.color(power.tolist())
     return params
 
 
-def convert_sun_light(ctx, b_light):
+def convert_sun_light(ctx, b_light, power):
     params = {'type': 'sun light'}
     params['angle'] = np.rad2deg(b_light.data.angle / 2.0)
-    params['irradiance'] = ctx.color(b_light.data.energy * b_light.data.color)
+    params['irradiance'] = ctx.color(power.tolist())
     params['transform'] = ctx.transform_matrix(b_light.matrix_world)
     return params
 
 
-def convert_spot_light(ctx, b_light):
+def convert_spot_light(ctx, b_light, power):
     params = {'type': 'spot light'}
     params['radius'] = b_light.data.shadow_soft_size
-    params['power'] = ctx.color(b_light.data.energy * b_light.data.color)
+    params['power'] = ctx.color(power.tolist())
     params['cutoff angle'] = np.rad2deg(b_light.data.spot_size / 2.0)
     params['cutoff blur'] = b_light.data.spot_blend
     params['transform'] = ctx.transform_matrix(b_light.matrix_world)
     return params
 
 
+LIGHT_CONVERTERS = {
+    'AREA': convert_area_light,
+    'POINT': convert_point_light,
+    'SUN': convert_sun_light,
+    'SPOT': convert_spot_light
+}
+
+
 def export(ctx, b_lights):
 
-    light_converters = {
-        'AREA': convert_area_light,
-        'POINT': convert_point_light,
-        'SUN': convert_sun_light,
-        'SPOT': convert_spot_light
-    }
+    # compute the (colored) power of all lights at once
+    energies = np.fromiter((l.data.energy for l in b_lights),
+                           dtype=np.float64, count=len(b_lights))
+    colors = np.array([l.data.color[:] for l in b_lights],
+                      dtype=np.float64).reshape(-1, 3)
+    powers = energies[:, None] * colors
 
     params = []
-    for l in b_lights:
+    for l, power in zip(b_lights, powers):
         try:
-            ctx.info(f"Creating a '{l.data.type}' light.")
-            params.append(light_converters[l.data.type](ctx, l))
+            if ctx.verbose:
+                ctx.info(f"Creating a '{l.data.type}' light.")
+            params.append(LIGHT_CONVERTERS[l.data.type](ctx, l, power))
         except KeyError:
             ctx.report(
                 {'WARNING'}, f"Could not export '{l.name_full}'; light type {l.data.type} is not supported.")
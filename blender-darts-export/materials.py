@@ -1,5 +1,4 @@
-import numpy as np
-import bpy
+import functools
 
 from . import textures
 
@@ -7,6 +6,11 @@ RoughnessMode = {'GGX': 'ggx', 'BECKMANN': 'beckmann',
                  'ASHIKHMIN_SHIRLEY': 'blinn', 'MULTI_GGX': 'ggx'}
 
 
+@functools.lru_cache(maxsize=None)
+def roughness_to_blinn_exponent(alpha):
+    return max(2.0 / (alpha * alpha) - 1.0, 0.0)
+
+
 def make_two_sided(ctx, bsdf):
     if ctx.force_two_sided:
         ctx.info(
@@ -31,69 +35,58 @@ def convert_diffuse_material(ctx, node):
 def convert_glossy_material(ctx, node):
     params = {}
 
-    if ctx.glossy_mode == 'rough conductor':
-        if node.distribution != 'SHARP':
-            params.update({
-                'type': ctx.glossy_mode,
-                'distribution': RoughnessMode[node.distribution],
-            })
-
-            params.update({
-                'roughness': textures.convert_texture_node(ctx, node.inputs['Roughness']),
-            })
-            if 'Anisotropy' in node.inputs:
-                params.update({
-                    'anisotropy': textures.convert_texture_node(ctx, node.inputs['Anisotropy']),
-                })
-            if 'Rotation' in node.inputs:
-                params.update({
-                    'rotation': textures.convert_texture_node(ctx, node.inputs['Rotation']),
-                })
-
+    # look up the node's sockets and settings once; each access goes through Blender's RNA
+    inputs = node.inputs
+    glossy_mode = ctx.glossy_mode
+    distribution = node.distribution
+
+    if glossy_mode == 'rough conductor':
+        if distribution != 'SHARP':
+            params['type'] = glossy_mode
+            params['distribution'] = RoughnessMode[distribution]
+            params['roughness'] = textures.convert_texture_node(
+                ctx, inputs['Roughness'])
+            anisotropy = inputs.get('Anisotropy')
+            if anisotropy is not None:
+                params['anisotropy'] = textures.convert_texture_node(
+                    ctx, anisotropy)
+            rotation = inputs.get('Rotation')
+            if rotation is not None:
+                params['rotation'] = textures.convert_texture_node(
+                    ctx, rotation)
         else:
-            params.update({
-                'type': 'conductor'
-            })
+            params['type'] = 'conductor'
 
-        params.update({
-            'color': textures.convert_texture_node(ctx, node.inputs['Color']),
-        })
+        params['color'] = textures.convert_texture_node(
+            ctx, inputs['Color'])
 
-    elif ctx.glossy_mode == 'blinn-phong' or ctx.glossy_mode == 'phong':
-        if node.inputs['Roughness'].is_linked:
+    elif glossy_mode == 'blinn-phong' or glossy_mode == 'phong':
+        roughness_input = inputs['Roughness']
+        if roughness_input.is_linked:
             raise NotImplementedError(
                 "Phong and Blinn-Phong roughness parameter doesn't support textures in Darts")
         else:
-            def roughness_to_blinn_exponent(alpha):
-                return max(2.0 / (alpha * alpha) - 1.0, 0.0)
-
             roughness = roughness_to_blinn_exponent(
-                pow(node.inputs['Roughness'].default_value, 2))
-            if ctx.glossy_mode == 'phong':
+                pow(roughness_input.default_value, 2))
+            if glossy_mode == 'phong':
                 roughness = roughness / 4
 
-        if node.distribution != 'SHARP':
-            params.update({
-                'type': ctx.glossy_mode,
-                'exponent': roughness,
-                'distribution': RoughnessMode[node.distribution],
-            })
+        if distribution != 'SHARP':
+            params['type'] = glossy_mode
+            params['exponent'] = roughness
+            params['distribution'] = RoughnessMode[distribution]
         else:
-            params.update({
-                'type': 'metal',
-                'roughness': 0
-            })
-
-        params.update({
-            'albedo': textures.convert_texture_node(ctx, node.inputs['Color']),
-        })
-    elif ctx.glossy_mode == 'metal':
-        params.update({
-            'type': ctx.glossy_mode,
-            'roughness': textures.convert_texture_node(ctx,
-                                                       node.inputs['Roughness']) if node.distribution != 'SHARP' else 0,
-            'albedo': textures.convert_texture_node(ctx, node.inputs['Color']),
-        })
+            params['type'] = 'metal'
+            params['roughness'] = 0
+
+        params['albedo'] = textures.convert_texture_node(
+            ctx, inputs['Color'])
+    elif glossy_mode == 'metal':
+        params['type'] = glossy_mode
+        params['roughness'] = textures.convert_texture_node(ctx,
+                                                            inputs['Roughness']) if distribution != 'SHARP' else 0
+        params['albedo'] = textures.convert_texture_node(
+            ctx, inputs['Color'])
 
     return make_two_sided(ctx, params)
 
@@ -101,26 +94,27 @@ def convert_glossy_material(ctx, node):
 def convert_glass_material(ctx, node):
     params = {}
 
-    if node.inputs['IOR'].is_linked:
+    inputs = node.inputs
+    ior_input = inputs['IOR']
+    if ior_input.is_linked:
         ctx.report(
             {'WARNING'}, f"{node.name}: Textured IOR values are not supported in Darts. Using the default value instead.")
 
-    ior = node.inputs['IOR'].default_value
+    ior = ior_input.default_value
 
-    roughness = textures.convert_texture_node(ctx, node.inputs['Roughness'])
+    roughness = textures.convert_texture_node(ctx, inputs['Roughness'])
 
-    if roughness and node.distribution != 'SHARP':
-        params.update({
-            'type': 'rough dielectric',
-            'roughness': roughness,
-            'distribution': RoughnessMode[node.distribution],
-        })
+    distribution = node.distribution
+    if roughness and distribution != 'SHARP':
+        params['type'] = 'rough dielectric'
+        params['roughness'] = roughness
+        params['distribution'] = RoughnessMode[distribution]
     else:
         params['type'] = 'thin dielectric' if ior == 1.0 else 'dielectric'
 
     params['ior'] = ior
     params['reflectance'] = params['transmittance'] = textures.convert_texture_node(
-        ctx, node.inputs['Color'])
+        ctx, inputs['Color'])
 
     return params
 
@@ -136,10 +130,9 @@ def convert_emitter_material(ctx, node):
         raise NotImplementedError(
             "Only default emitter color is supported")  # TODO: rgb input
     else:
-        radiance = [
-            x * radiance for x in node.inputs['Color'].default_value[:]]
+        radiance = [c * radiance for c in node.inputs['Color'].default_value[:3]]
 
-    if np.sum(radiance) == 0:
+    if not any(radiance):
         ctx.report(
             {'WARN'}, "  Emitter has zero emission, this may cause Darts to fail! Creating a 'diffuse' material instead.")
         return {'type': 'diffuse', 'albedo': ctx.color(0)}
@@ -158,38 +151,36 @@ def convert_transparent_material(ctx, node):
     }
 
 
-def convert_mix_material(ctx, node):
+def linked_shaders(ctx, node):
+    '''The two shader nodes combined by a mix or add shader node'''
     if not node.inputs[1].is_linked or not node.inputs[2].is_linked:
-        raise NotImplementedError("Mix shader is not linked to two materials")
+        raise NotImplementedError(
+            f"{node.bl_label} is not linked to two materials")
+
+    return (ctx.input_link(node.inputs[1]).from_node,
+            ctx.input_link(node.inputs[2]).from_node)
 
-    mat_I = ctx.follow_link(node.inputs[1]).links[0].from_node
-    mat_II = ctx.follow_link(node.inputs[2]).links[0].from_node
 
+def convert_mix_material(ctx, node, mat_I, mat_II):
     return {
         'type': 'blend',
         'amount': textures.convert_texture_node(ctx, node.inputs['Fac']),
-        'a': cycles_material_to_dict(ctx, mat_I),
-        'b': cycles_material_to_dict(ctx, mat_II)
+        'a': mat_I,
+        'b': mat_II
     }
 
 
-def convert_add_material(ctx, node):
-    if not node.inputs[1].is_linked or not node.inputs[2].is_linked:
-        raise NotImplementedError("Add shader is not linked to two materials")
-
-    mat_I = ctx.follow_link(node.inputs[1]).links[0].from_node
-    mat_II = ctx.follow_link(node.inputs[2]).links[0].from_node
-
+def convert_add_material(ctx, node, mat_I, mat_II):
     return {
         'type': 'add',
-        'a': cycles_material_to_dict(ctx, mat_I),
-        'b': cycles_material_to_dict(ctx, mat_II)
+        'a': mat_I,
+        'b': mat_II
     }
 
 
 def wrap_with_bump_or_normal_map(ctx, node, nested):
-    if (ctx.use_normal_maps or ctx.use_bump_maps) and 'Normal' in node.inputs and node.inputs['Normal'].is_linked:
-        n = ctx.follow_link(node.inputs['Normal']).links[0].from_node
+    if 'Normal' in node.inputs and node.inputs['Normal'].is_linked:
+        n = ctx.input_link(node.inputs['Normal']).from_node
 
         if n.bl_idname == "ShaderNodeNormalMap":
             if not ctx.use_normal_maps:
@@ -217,9 +208,6 @@ def wrap_with_bump_or_normal_map(ctx, node, nested):
             raise NotImplementedError(
                 "Only normal map and bump nodes supported for 'Normal' input")
 
-        if 'name' in nested:
-            wrapper['name'] = nested.pop('name')
-
         wrapper['nested'] = nested
 
         ctx.info(f"  Wrapping material with a '{wrapper['type']}'.")
@@ -228,37 +216,73 @@ def wrap_with_bump_or_normal_map(ctx, node, nested):
         return nested
 
 
+def convert_shader_node(ctx, node, children):
+    '''Convert a single shader node, given the already converted shaders it combines (if any)'''
+
+    ctx.info(f"Converting a '{node.bl_idname}' Blender material.")
+    if node.bl_idname in SHADER_COMBINERS:
+        params = SHADER_COMBINERS[node.bl_idname](ctx, node, *children)
+    elif node.bl_idname in CYCLES_CONVERTERS:
+        params = CYCLES_CONVERTERS[node.bl_idname](ctx, node)
+    else:
+        raise NotImplementedError(
+            f"Node type: {node.bl_idname} is not supported in Darts")
+    ctx.info(f"  Created a '{params['type']}' material.")
+
+    if ctx.use_normal_maps or ctx.use_bump_maps:
+        params = wrap_with_bump_or_normal_map(ctx, node, params)
+    return params
+
+
 def cycles_material_to_dict(ctx, node, name=None):
     ''' Converting one material from Blender to Darts format'''
 
-    cycles_converters = {
-        "ShaderNodeBsdfDiffuse": convert_diffuse_material,
-        'ShaderNodeBsdfGlossy': convert_glossy_material,
-        'ShaderNodeBsdfAnisotropic': convert_glossy_material,
-        'ShaderNodeBsdfGlass': convert_glass_material,
-        'ShaderNodeMixShader': convert_mix_material,
-        'ShaderNodeAddShader': convert_add_material,
-        'ShaderNodeEmission': convert_emitter_material,
-        'ShaderNodeBsdfTransparent': convert_transparent_material,
-    }
+    # Mix and add shaders form (possibly deep) trees of materials. Instead of recursing, we walk these
+    # with an explicit stack, converting the children of a mix/add shader before the shader itself.
+    # Sub-graphs can also be shared (e.g. by several mix shaders), so we only convert each node once.
+    def key(n):
+        return (n.id_data.as_pointer(), n.name)
+
+    stack = [(node, False)]
+    while stack:
+        current, children_converted = stack.pop()
+        if key(current) in ctx.node_cache:
+            continue
+
+        if current.bl_idname in SHADER_COMBINERS and not children_converted:
+            stack.append((current, True))
+            stack.extend((child, False)
+                         for child in linked_shaders(ctx, current))
+        else:
+            children = (tuple(ctx.node_cache[key(child)] for child in linked_shaders(ctx, current))
+                        if current.bl_idname in SHADER_COMBINERS else ())
+            ctx.node_cache[key(current)] = convert_shader_node(
+                ctx, current, children)
 
-    params = {}
+    params = ctx.node_cache[key(node)]
     if name is not None:
-        params['name'] = material_name(name)
+        params = {'name': material_name(name), **params}
+    return params
 
-    if node.bl_idname in cycles_converters:
-        ctx.info(f"Converting a '{node.bl_idname}' Blender material.")
-        params.update(cycles_converters[node.bl_idname](ctx, node))
-        ctx.info(f"  Created a '{params['type']}' material.")
-    else:
-        raise NotImplementedError(
-            f"Node type: {node.bl_idname} is not supported in Darts")
 
-    return wrap_with_bump_or_normal_map(ctx, node, params)
+CYCLES_CONVERTERS = {
+    "ShaderNodeBsdfDiffuse": convert_diffuse_material,
+    'ShaderNodeBsdfGlossy': convert_glossy_material,
+    'ShaderNodeBsdfAnisotropic': convert_glossy_material,
+    'ShaderNodeBsdfGlass': convert_glass_material,
+    'ShaderNodeEmission': convert_emitter_material,
+    'ShaderNodeBsdfTransparent': convert_transparent_material,
+}
+
+# shaders that combine two other shaders
+SHADER_COMBINERS = {
+    'ShaderNodeMixShader': convert_mix_material,
+    'ShaderNodeAddShader': convert_add_material,
+}
 
 
 def material_name(b_name):
-    return f"{b_name.replace(' ', '_')}"
+    return b_name.replace(' ', '_')
 
 
 def get_dummy_material(ctx, name):
@@ -279,8 +303,8 @@ def convert_material(ctx, b_mat):
             output_node_id = 'Material Output'
             if output_node_id in b_mat.node_tree.nodes:
                 output_node = b_mat.node_tree.nodes[output_node_id]
-                surface_node = ctx.follow_link(
-                    output_node.inputs['Surface']).links[0].from_node
+                surface_node = ctx.input_link(
+                    output_node.inputs['Surface']).from_node
                 mat_params = cycles_material_to_dict(ctx,
                                                      surface_node, b_mat.name_full)
                 if 'Displacement' in output_node.inputs and output_node.inputs['Displacement'].is_linked:
@@ -299,6 +323,30 @@ def convert_material(ctx, b_mat):
     return mat_params
 
 
+def used_materials(ctx, meshes):
+    """Collect the materials used by meshes, each listed once (in order of first use)"""
+
+    mats = {}
+    for mesh in meshes:
+        # (empties have no data, so no materials)
+        mesh_materials = getattr(mesh.data, 'materials', None)
+        if not mesh_materials:
+            continue
+        if ctx.verbose:
+            ctx.info(
+                f"Object '{mesh.name_full}' of type '{mesh.type}' has {len(mesh_materials)} materials.")
+        for mat in mesh_materials:
+            # skip any materials that aren't being used
+            if not mat or mat in mats:
+                continue
+            if mat.name_full == "Dots Stroke" or mat.users == 0:
+                ctx.info(f"Skipping unused material '{mat.name_full}'")
+                continue
+            mats[mat] = None
+
+    return list(mats)
+
+
 def export(ctx, meshes):
     """Write out the materials to Darts format"""
 
@@ -312,45 +360,27 @@ def export(ctx, meshes):
     ]
 
     if ctx.material_mode == "LAMBERTIAN":
-        for mat in bpy.data.materials:
-            # skip any materials that aren't being used
-            if mat.name_full == "Dots Stroke" or mat.users == 0:
-                continue
-
+        for mat in used_materials(ctx, meshes):
             ctx.info(f"Writing placeholder for material '{mat.name_full}'")
-            name = mat.name_full
             params = get_dummy_material(
                 ctx, mat.name_full)
             mat_json.append(params)
 
     elif ctx.material_mode == "CONVERT":
-        for mesh in meshes:
-            if not mesh.data or not mesh.data.materials:
+        for mat in used_materials(ctx, meshes):
+            # skip if we've already exported this material
+            mat_id = f"mat-{mat.name_full}"
+            if mat_id in ctx.already_exported:
+                ctx.info(
+                    f"Skipping previously exported material '{mat.name_full}'.")
                 continue
-            ctx.info(
-                f"Object '{mesh.name_full}' of type '{mesh.type}' has {len(mesh.data.materials)} materials.")
-            for mat in mesh.data.materials:
-
-                # skip any materials that aren't being used
-                if not mat:
-                    continue
-                if mat.name_full == "Dots Stroke" or mat.users == 0:
-                    ctx.info(f"Skipping unused material '{mat.name_full}'")
-                    continue
-
-                # skip if we've already exported this material
-                mat_id = f"mat-{mat.name_full}"
-                if mat_id in ctx.already_exported.keys():
-                    ctx.info(
-                        f"Skipping previously exported material '{mat.name_full}'.")
-                    continue
 
-                ctx.info(
-                    f"Exporting material '{mat.name_full}', with {mat.users} users.")
+            ctx.info(
+                f"Exporting material '{mat.name_full}', with {mat.users} users.")
 
-                mat_params = convert_material(ctx, mat)
-                ctx.already_exported[mat_id] = mat_params
+            mat_params = convert_material(ctx, mat)
+            ctx.already_exported[mat_id] = mat_params
 
-                mat_json.append(mat_params)
+            mat_json.append(mat_params)
 
     return mat_json
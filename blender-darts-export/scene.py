@@ -1,21 +1,75 @@
 import os
 import time
+from collections import defaultdict
 import bpy
 from mathutils import Matrix
 from mathutils import Vector
 from mathutils import Euler
 from mathutils import Quaternion
-from math import degrees
 import json
 
+try:
+    # orjson is considerably faster than the standard json module, but is not bundled with Blender
+    import orjson
+except ImportError:
+    orjson = None
+
 from . import materials
 from . import textures
 from . import lights
 from . import geometry
 from . import camera
 
-SUPPORTED_TYPES = {"MESH", "CURVE", "FONT", "META",
-                   "EMPTY", "SURFACE"}  # Formats we can save as .obj
+SUPPORTED_TYPES = frozenset({"MESH", "CURVE", "FONT", "META",
+                             "EMPTY", "SURFACE"})  # Formats we can save as .obj
+
+IDENTITY = Matrix.Identity(4).freeze()
+
+
+def json_default(obj):
+    '''Convert mathutils types (Vector, Color, Euler, Matrix, ...) to lists for json serialization'''
+    if isinstance(obj, Matrix):
+        return [list(row) for row in obj]
+    try:
+        return list(obj)
+    except TypeError:
+        raise TypeError(
+            f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    '''Serialize obj to (indented) json bytes'''
+    if orjson is not None:
+        return orjson.dumps(obj,
+                            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY,
+                            default=json_default)
+    else:
+        return json.dumps(obj, indent=2, default=json_default).encode()
+
+
+def write_json(dump_file, data):
+    '''
+    Stream the scene dict to a (binary) file one top-level field, and one list entry, at a time.
+
+    This way we never hold the serialized string for the whole scene in memory, only that of the largest entry.
+    The output uses the same 2-space indentation throughout (the only width orjson supports).
+    '''
+    def indented(entry, indent):
+        return indent + entry.replace(b'\n', b'\n' + indent)
+
+    dump_file.write(b'{')
+    for i, (key, value) in enumerate(data.items()):
+        dump_file.write(b',\n' if i else b'\n')
+        dump_file.write(indented(dumps(key), b'  ') + b': ')
+        if isinstance(value, list):
+            dump_file.write(b'[')
+            for j, item in enumerate(value):
+                dump_file.write(b',\n' if j else b'\n')
+                dump_file.write(indented(dumps(item), b'    '))
+            dump_file.write(b'\n  ]' if value else b']')
+        else:
+            dump_file.write(dumps(value).replace(b'\n', b'\n  '))
+    dump_file.write(b'\n}\n')
 
 
 class SceneWriter:
@@ -28,6 +82,7 @@ class SceneWriter:
                  report,
                  filepath,
                  write_obj_files,
+                 reuse_obj_cache,
                  write_texture_files,
                  verbose,
                  use_selection,
@@ -36,6 +91,7 @@ class SceneWriter:
                  sampler,
                  use_lights,
                  mesh_mode,
+                 eval_mode,
                  material_mode,
                  glossy_mode,
                  use_normal_maps,
@@ -59,6 +115,7 @@ class SceneWriter:
         self.report = report
 
         self.write_obj_files = write_obj_files
+        self.reuse_obj_cache = reuse_obj_cache
 
         self.verbose = verbose
         self.use_selection = use_selection
@@ -69,6 +126,7 @@ class SceneWriter:
         self.use_lights = use_lights
 
         self.mesh_mode = mesh_mode
+        self.eval_mode = eval_mode
 
         self.material_mode = material_mode
         self.write_texture_files = write_texture_files
@@ -95,19 +153,40 @@ class SceneWriter:
         self.filepath = filepath
         self.directory = os.path.dirname(filepath)
         self.already_exported = {}
+        self.node_cache = {}
+        self.texture_cache = {}
+        self.texture_node_cache = {}
+        self.link_cache = {}
+        self.by_type = defaultdict(list)
 
     def info(self, message):
         if self.verbose:
             self.report({'INFO'}, message)
 
-    def follow_link(self, socket):
+    def link_map(self, node_tree):
+        '''
+        Map the (pointers of the) linked input sockets of node_tree to their incoming link.
+
+        Accessing socket.links scans all the links of the node tree, so we do this only once per tree.
+        '''
+        key = node_tree.as_pointer()
+        if key not in self.link_cache:
+            self.link_cache[key] = {link.to_socket.as_pointer(): link
+                                    for link in node_tree.links}
+        return self.link_cache[key]
+
+    def input_link(self, socket):
         '''
-        Recursively follow a link potentially via reroute nodes
+        The link into socket, following it back through any reroute nodes. None if socket is not linked
         '''
-        if socket.is_linked and socket.links[0].from_node.bl_idname == 'NodeReroute':
-            return self.follow_link(socket.links[0].from_node.inputs[0])
-        else:
-            return socket
+        links = self.link_map(socket.id_data)
+        link = links.get(socket.as_pointer())
+        while link is not None and link.from_node.bl_idname == 'NodeReroute':
+            upstream = links.get(link.from_node.inputs[0].as_pointer())
+            if upstream is None:
+                break
+            link = upstream
+        return link
 
     def color(self, value):
         '''
@@ -124,9 +203,11 @@ class SceneWriter:
             col = value
         else:
             value = list(value)
-            if any(not isinstance(x, (float, int, tuple)) for x in value):
+            # all entries need to have the same (supported) type, so it's enough to check the first one
+            first_type = type(value[0]) if value else float
+            if not issubclass(first_type, (float, int, tuple)):
                 raise ValueError(f"Unknown color entry: {value}")
-            if any(type(value[i]) != type(value[i+1]) for i in range(len(value)-1)):
+            if any(type(x) is not first_type for x in value):
                 raise ValueError(f"Mixed types in color entry {value}")
             totitems = len(value)
             if isinstance(value[0], (float, int)):
@@ -149,23 +230,15 @@ class SceneWriter:
         else:  # 3x3
             mat = matrix.to_4x4()
 
-        loc, rot, sca = mat.decompose()
-        eul = rot.to_euler()
-        self.info(
-            f"Writing matrix: {mat}, as\n\t{loc}\n\t{tuple(degrees(a) for a in eul)}\n\t{sca}")
-
-        params = []
-        if eul[:] != (0, 0, 0):
-            params.extend([{'rotate': (degrees(eul.x), 1, 0, 0)},
-                           {'rotate': (degrees(eul.y), 0, 1, 0)},
-                           {'rotate': (degrees(eul.z), 0, 0, 1)}])
-        if sca[:] != (1, 1, 1):
-            params.append({'scale': sca[:]})
-        if loc[:] != (0, 0, 0):
-            params.append({'translate': loc[:]})
-        return params
+        if mat == IDENTITY:
+            return []
+
+        if self.verbose:
+            self.info(f"Writing matrix: {mat}")
 
-        # return {'matrix': list(i for j in mat for i in j)}
+        # a single row-major 4x4 matrix is cheaper to write (and read back in Darts) than a
+        # decomposed rotate/scale/translate sequence, and is also exact for sheared transforms
+        return [{'matrix': [x for row in mat for x in row]}]
 
     def make_misc(self):
         """Adds default values to make the scene complete"""
@@ -195,6 +268,30 @@ class SceneWriter:
 
         return params
 
+    def collect_objects(self):
+        """
+        Partition the objects to export by type, in a single pass over the scene.
+
+        Returns the objects grouped by type, and the list of all objects we can save as meshes (in scene order)
+        """
+
+        by_type = defaultdict(list)
+        meshes = []
+        for o in self.context.scene.objects:
+            # start with just the objects visible to the renderer,
+            # and figure out the list based on the export settings
+            if o.hide_render:
+                continue
+            if self.use_selection and not o.select_get():
+                continue
+            if self.use_visibility and not o.visible_get():
+                continue
+            by_type[o.type].append(o)
+            if o.type in SUPPORTED_TYPES:
+                meshes.append(o)
+
+        return by_type, meshes
+
     def write(self):
         """Main method to write the blender scene into Darts format"""
 
@@ -204,6 +301,8 @@ class SceneWriter:
         if bpy.ops.object.mode_set.poll():
             bpy.ops.object.mode_set(mode='OBJECT')
 
+        self.by_type, b_meshes = self.collect_objects()
+
         data_all = {}
 
         data_all["camera"] = camera.export(self, self.context.scene)
@@ -211,17 +310,6 @@ class SceneWriter:
         # adding defaults
         data_all.update(self.make_misc())
 
-        # start with just the objects visible to the renderer
-        objects = [o for o in self.context.scene.objects if not o.hide_render]
-
-        # figure out the list based on the export settings
-        if self.use_selection:
-            objects = [o for o in objects if o.select_get()]
-        if self.use_visibility:
-            objects = [o for o in objects if o.visible_get()]
-
-        b_meshes = [o for o in objects if o.type in SUPPORTED_TYPES]
-
         # export the materials
         data_all["materials"] = materials.export(self, b_meshes)
 
@@ -230,14 +318,12 @@ class SceneWriter:
 
         # export lights
         if self.use_lights:
-            b_lights = [o for o in objects if o.type in {'LIGHT'}]
-            data_all["surfaces"].extend(lights.export(self, b_lights))
-
-        # write the json file
-        with open(self.filepath, "w") as dump_file:
-            exported_json_string = json.dumps(data_all, indent=4)
-            dump_file.write(exported_json_string)
-            dump_file.close
+            data_all["surfaces"].extend(
+                lights.export(self, self.by_type['LIGHT']))
+
+        # write the json file (with a large buffer, so the many small per-entry writes only hit the disk in big chunks)
+        with open(self.filepath, "wb", buffering=1 << 20) as dump_file:
+            write_json(dump_file, data_all)
 
         end = time.perf_counter()
         self.report(
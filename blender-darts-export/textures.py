@@ -1,7 +1,7 @@
-import numpy as np
 from mathutils import Matrix
 from collections.abc import Iterable
 import os
+import bpy
 
 
 def dummy_color(ctx):
@@ -13,10 +13,16 @@ def convert_vector_node(ctx, socket):
     if not socket.is_linked or not ctx.enable_mapping:
         return None
 
-    socket = ctx.follow_link(socket)
+    if socket.is_output:
+        # e.g. a coordinate or mapping node used directly as a texture: the socket is the node's own output
+        from_node, from_socket = socket.node, socket
+    else:
+        link = ctx.input_link(socket)
+        if link is None:
+            return None
+        from_node, from_socket = link.from_node, link.from_socket
 
-    def export_coord_node(ctx, socket):
-        from_node = socket.from_node
+    def export_coord_node(ctx, from_node, from_socket):
         if from_node.bl_idname != 'ShaderNodeTexCoord':
             raise NotImplementedError(
                 f"Unsupported node type: {from_node.bl_idname}. Expecting a 'ShaderNodeTexCoord'")
@@ -24,45 +30,48 @@ def convert_vector_node(ctx, socket):
             ctx.report(
                 {'WARNING'}, "Darts does not currently support texture coordinates from other objects. Ignoring.")
 
-        ctx.info(
-            f"Writing '{socket.from_socket.name.lower()}' coordinate node")
-        return {'coordinate': socket.from_socket.name.lower()}
-
-    def export_mapping_node(ctx, socket):
-        from_node = socket.from_node
+        coordinate = from_socket.name.lower()
+        ctx.info(f"Writing '{coordinate}' coordinate node")
+        return {'coordinate': coordinate}
 
+    def export_mapping_node(ctx, from_node):
         params = {'vector type': from_node.vector_type.lower()}
         ctx.info(f"Writing '{params['vector type']}' mapping node.")
 
-        if from_node.inputs['Location'].is_linked or from_node.inputs['Rotation'].is_linked or from_node.inputs['Scale'].is_linked:
+        inputs = from_node.inputs
+        location, rotation, scale = inputs['Location'], inputs['Rotation'], inputs['Scale']
+        if location.is_linked or rotation.is_linked or scale.is_linked:
             raise NotImplementedError(
                 "Location, Rotation, and Scale inputs shouldn't be linked")
 
-        L = from_node.inputs['Location'].default_value
-        R = from_node.inputs['Rotation'].default_value
-        S = from_node.inputs['Scale'].default_value
-        M = Matrix.LocRotScale(L, R, S)
-        if M != Matrix.Identity(4):
+        L = location.default_value
+        R = rotation.default_value
+        S = scale.default_value
+        # most mapping nodes are left at their defaults, so check that before building any matrices
+        if L[:] != (0, 0, 0) or R[:] != (0, 0, 0) or S[:] != (1, 1, 1):
+            M = Matrix.LocRotScale(L, R, S)
             params["transform"] = ctx.transform_matrix(M.inverted())
 
-        if not from_node.inputs['Vector'].is_linked:
+        vector = inputs['Vector']
+        vector_link = ctx.input_link(vector) if vector.is_linked else None
+        if vector_link is None:
             raise NotImplementedError(
                 f"The node {from_node.bl_idname} should be linked with a 'ShaderNodeTexCoord'")
         params.update(export_coord_node(
-            ctx, ctx.follow_link(from_node.inputs['Vector']).links[0]))
+            ctx, vector_link.from_node, vector_link.from_socket))
 
         return params
 
     params = {'type': 'transform'}
 
-    from_node = socket.links[0].from_node
-    if from_node.bl_idname == 'ShaderNodeTexCoord':
-        params.update(export_coord_node(ctx, socket.links[0]))
-    elif from_node.bl_idname == 'ShaderNodeMapping':
-        params.update(export_mapping_node(ctx, socket.links[0]))
+    bl_idname = from_node.bl_idname
+    if bl_idname == 'ShaderNodeTexCoord':
+        params.update(export_coord_node(ctx, from_node, from_socket))
+    elif bl_idname == 'ShaderNodeMapping':
+        params.update(export_mapping_node(ctx, from_node))
     else:
         raise NotImplementedError(
-            f"Unsupported node type: {from_node.bl_idname}. Expecting either a 'ShaderNodeTexCoord' or a 'ShaderNodeMapping'")
+            f"Unsupported node type: {bl_idname}. Expecting either a 'ShaderNodeTexCoord' or a 'ShaderNodeMapping'")
 
     return params
 
@@ -73,6 +82,28 @@ def add_vector_node_field(ctx, params, socket):
         params["mapping"] = mapping
 
 
+# file extension of the image formats Darts can read
+TEXTURE_EXTS = {
+    'BMP': '.bmp',
+    'HDR': '.hdr',
+    'JPEG': '.jpg',
+    'JPEG2000': '.jpg',
+    'PNG': '.png',
+    'OPEN_EXR': '.exr',
+    'OPEN_EXR_MULTILAYER': '.exr',
+    'TARGA': '.tga',
+    'TARGA_RAW': '.tga',
+}
+
+# image formats Darts cannot read, and the format we convert them to on export
+CONVERT_FORMAT = {
+    'CINEON': 'EXR',
+    'DPX': 'EXR',
+    'TIFF': 'PNG',
+    'IRIS': 'PNG'
+}
+
+
 def export_texture(ctx, image):
     """
     Return the path to a texture.
@@ -81,50 +112,72 @@ def export_texture(ctx, image):
     image : The Blender Image object
     """
 
-    texture_exts = {
-        'BMP': '.bmp',
-        'HDR': '.hdr',
-        'JPEG': '.jpg',
-        'JPEG2000': '.jpg',
-        'PNG': '.png',
-        'OPEN_EXR': '.exr',
-        'OPEN_EXR_MULTILAYER': '.exr',
-        'TARGA': '.tga',
-        'TARGA_RAW': '.tga',
-    }
-
-    convert_format = {
-        'CINEON': 'EXR',
-        'DPX': 'EXR',
-        'TIFF': 'PNG',
-        'IRIS': 'PNG'
-    }
-
     textures_folder = os.path.join(ctx.directory, "textures")
-    if image.file_format in convert_format:
+    if image.file_format in CONVERT_FORMAT:
         ctx.info(
-            f"Image format of '{image.name}' is not supported. Converting it to {convert_format[image.file_format]}.")
-        image.file_format = convert_format[image.file_format]
+            f"Image format of '{image.name}' is not supported. Converting it to {CONVERT_FORMAT[image.file_format]}.")
+        image.file_format = CONVERT_FORMAT[image.file_format]
     original_name = os.path.basename(image.filepath)
     # Try to remove extensions from names of packed files to avoid stuff like 'Image.png.001.png'
     if original_name != '' and image.name.startswith(original_name):
         base_name, _ = os.path.splitext(original_name)
         name = image.name.replace(
             original_name, base_name, 1)  # Remove the extension
-        name += texture_exts[image.file_format]
+        name += TEXTURE_EXTS[image.file_format]
     else:
-        name = f"{image.name}{texture_exts[image.file_format]}"
+        name = f"{image.name}{TEXTURE_EXTS[image.file_format]}"
     if ctx.write_texture_files:
         target_path = os.path.join(textures_folder, name)
-        if not os.path.isdir(textures_folder):
-            os.makedirs(textures_folder)
-        old_filepath = image.filepath
-        image.filepath_raw = target_path
-        image.save()
-        image.filepath_raw = old_filepath
+        texture_id = f"texture-{target_path}"
+        if texture_id in ctx.already_exported or texture_is_current(image, target_path):
+            ctx.info(f"  Skipping unchanged texture '{name}'.")
+        else:
+            os.makedirs(textures_folder, exist_ok=True)
+            old_filepath = image.filepath
+            image.filepath_raw = target_path
+            image.save()
+            image.filepath_raw = old_filepath
+        ctx.already_exported[texture_id] = None
     return f"textures/{name}"
 
 
+def texture_is_current(image, target_path):
+    '''
+    Check whether target_path is already at least as new as the (unmodified) image file it would be saved from
+    '''
+    if image.source != 'FILE' or image.packed_file is not None or image.is_dirty:
+        return False
+    source_path = bpy.path.abspath(image.filepath, library=image.library)
+    return (os.path.isfile(source_path) and os.path.isfile(target_path) and
+            os.path.getmtime(target_path) >= os.path.getmtime(source_path))
+
+
+def image_params(ctx, image):
+    '''
+    Export an image (once) and return the image-specific parameters of a Darts image texture
+    '''
+    key = image.as_pointer()
+    if key in ctx.texture_cache:
+        return dict(ctx.texture_cache[key])
+
+    # get the relative path to the copied texture from the full path to the original texture
+    params = {'filename': export_texture(ctx, image)}
+
+    colorspace = image.colorspace_settings.name
+    if colorspace in {'Non-Color', 'Raw', 'Linear'}:
+        # non color data, tell Darts not to apply gamma conversion to it
+        params['raw'] = True
+    elif colorspace != 'sRGB':
+        ctx.report(
+            {'WARNING'}, f"Texture '{image}' uses {colorspace} colorspace. Darts only supports sRGB textures for color data.")
+
+    ctx.texture_cache[key] = params
+    return dict(params)
+
+
+WRAP_MODES = {"REPEAT": "repeat", "EXTEND": "CLAMP", "CLIP": "black"}
+
+
 def convert_image_texture_node(ctx, out_socket):
     '''
     Python API: https://docs.blender.org/api/3.3/bpy.types.ShaderNodeTexImage.html
@@ -134,16 +187,7 @@ def convert_image_texture_node(ctx, out_socket):
     params = {
         'type': 'image'
     }
-
-    # get the relative path to the copied texture from the full path to the original texture
-    params['filename'] = export_texture(ctx, node.image)
-
-    if node.image.colorspace_settings.name in ['Non-Color', 'Raw', 'Linear']:
-        # non color data, tell Darts not to apply gamma conversion to it
-        params['raw'] = True
-    elif node.image.colorspace_settings.name != 'sRGB':
-        ctx.report(
-            {'WARNING'}, f"Texture '{node.image}' uses {node.image.colorspace_settings.name} colorspace. Darts only supports sRGB textures for color data.")
+    params.update(image_params(ctx, node.image))
 
     if out_socket.name == "Color":
         params['output'] = "color"
@@ -158,8 +202,7 @@ def convert_image_texture_node(ctx, out_socket):
     if node.extension == 'CLIP':
         ctx.report(
             {'WARNING'}, f"'CLIP' extension mode behaves differently in Blender than in Darts.")
-    modes = {"REPEAT": "repeat", "EXTEND": "CLAMP", "CLIP": "black"}
-    params['wrap mode x'] = params['wrap mode y'] = modes[node.extension]
+    params['wrap mode x'] = params['wrap mode y'] = WRAP_MODES[node.extension]
 
     if node.projection != 'FLAT':
         ctx.report(
@@ -225,6 +268,9 @@ def convert_brick_texture_node(ctx, out_socket):
     return params
 
 
+WAVE_PROFILES = {"SIN": "sine", "SAW": "saw", "TRI": "triangle"}
+
+
 def convert_wave_texture_node(ctx, out_socket):
     '''
     Python API: https://docs.blender.org/api/3.3/bpy.types.ShaderNodeTexWave.html
@@ -234,12 +280,11 @@ def convert_wave_texture_node(ctx, out_socket):
         return ctx.color(0.5)
 
     node = out_socket.node
-    profiles = {"SIN": "sine", "SAW": "saw", "TRI": "triangle"}
     params = {
         'type': 'wave',
         'wave type': node.wave_type.lower(),
         'direction': node.bands_direction.lower() if node.wave_type == 'BANDS' else node.rings_direction.lower(),
-        'profile': profiles[node.wave_profile],
+        'profile': WAVE_PROFILES[node.wave_profile],
         'scale': convert_texture_node(ctx, node.inputs['Scale']),
         'distortion': convert_texture_node(ctx, node.inputs['Distortion']),
         'detail': convert_texture_node(ctx, node.inputs['Detail']),
@@ -253,6 +298,9 @@ def convert_wave_texture_node(ctx, out_socket):
     return params
 
 
+DIMENSIONS = {"1D": 1, "2D": 2, "3D": 3, "4D": 4}
+
+
 def convert_noise_texture_node(ctx, out_socket):
     '''
     Python API: https://docs.blender.org/api/3.3/bpy.types.ShaderNodeTexNoise.html
@@ -262,22 +310,21 @@ def convert_noise_texture_node(ctx, out_socket):
         return ctx.color(0.5)
 
     node = out_socket.node
-    dims = {"1D": 1, "2D": 2, "3D": 3, "4D": 4}
     params = {
         'type': 'noise',
         'scale': convert_texture_node(ctx, node.inputs['Scale']),
         'detail': convert_texture_node(ctx, node.inputs['Detail']),
         'roughness': convert_texture_node(ctx, node.inputs['Roughness']),
         'distortion': convert_texture_node(ctx, node.inputs['Distortion']),
-        'dimensions': dims[node.noise_dimensions],
+        'dimensions': DIMENSIONS[node.noise_dimensions],
         'output': 'float' if out_socket.name == 'Fac' else 'color'
     }
 
-    if dims[node.noise_dimensions] == 4:
+    if DIMENSIONS[node.noise_dimensions] == 4:
         params['w'] = convert_texture_node(ctx, node.inputs['W'])
 
     add_vector_node_field(ctx,
-                          params, node.inputs['Vector'] if dims[node.noise_dimensions] != 1 else node.inputs['W'])
+                          params, node.inputs['Vector'] if DIMENSIONS[node.noise_dimensions] != 1 else node.inputs['W'])
 
     return params
 
@@ -291,22 +338,21 @@ def convert_voronoi_texture_node(ctx, out_socket):
         return ctx.color(0.5)
 
     node = out_socket.node
-    dims = {"1D": 1, "2D": 2, "3D": 3, "4D": 4}
     params = {
         'type': 'voronoi',
         'scale': convert_texture_node(ctx, node.inputs['Scale']),
         'randomness': convert_texture_node(ctx, node.inputs['Randomness']),
-        'dimensions': dims[node.voronoi_dimensions],
+        'dimensions': DIMENSIONS[node.voronoi_dimensions],
         'feature': node.feature.lower().replace('_', ' '),
         'distance': node.distance.lower(),
         'output': out_socket.name.lower()
     }
 
-    if dims[node.voronoi_dimensions] == 4:
+    if DIMENSIONS[node.voronoi_dimensions] == 4:
         params['w'] = convert_texture_node(ctx, node.inputs['W'])
 
     add_vector_node_field(ctx,
-                          params, node.inputs['Vector'] if dims[node.voronoi_dimensions] != 1 else node.inputs['W'])
+                          params, node.inputs['Vector'] if DIMENSIONS[node.voronoi_dimensions] != 1 else node.inputs['W'])
 
     return params
 
@@ -320,7 +366,6 @@ def convert_musgrave_texture_node(ctx, out_socket):
         return ctx.color(0.5)
 
     node = out_socket.node
-    dims = {"1D": 1, "2D": 2, "3D": 3, "4D": 4}
     params = {
         'type': 'musgrave',
         'fractal type': node.musgrave_type.lower().replace('_', ' '),
@@ -330,14 +375,14 @@ def convert_musgrave_texture_node(ctx, out_socket):
         'lacunarity': convert_texture_node(ctx, node.inputs['Lacunarity']),
         'offset': convert_texture_node(ctx, node.inputs['Offset']),
         'gain': convert_texture_node(ctx, node.inputs['Gain']),
-        'dimensions': dims[node.noise_dimensions]
+        'dimensions': DIMENSIONS[node.noise_dimensions]
     }
 
-    if dims[node.noise_dimensions] == 4:
+    if DIMENSIONS[node.noise_dimensions] == 4:
         params['w'] = convert_texture_node(ctx, node.inputs['W'])
 
     add_vector_node_field(ctx,
-                          params, node.inputs['Vector'] if dims[node.noise_dimensions] != 1 else node.inputs['W'])
+                          params, node.inputs['Vector'] if DIMENSIONS[node.noise_dimensions] != 1 else node.inputs['W'])
 
     return params
 
@@ -478,39 +523,48 @@ def convert_coord_texture_node(ctx, out_socket):
     return params
 
 
+TEXTURE_CONVERTERS = {
+    'ShaderNodeBlackbody': convert_blackbody_node,
+    'ShaderNodeTexBrick': convert_brick_texture_node,
+    'ShaderNodeClamp': convert_clamp_node,
+    'ShaderNodeTexCoord': convert_coord_texture_node,
+    'ShaderNodeMapping': convert_coord_texture_node,
+    'ShaderNodeFresnel': convert_fresnel_node,
+    "ShaderNodeTexImage": convert_image_texture_node,
+    'ShaderNodeLayerWeight': convert_layer_weight_node,
+    'ShaderNodeMixRGB': convert_mix_rgb_node,
+    'ShaderNodeTexMusgrave': convert_musgrave_texture_node,
+    'ShaderNodeTexNoise': convert_noise_texture_node,
+    'ShaderNodeRGB': convert_rgb_node,
+    'ShaderNodeTexVoronoi': convert_voronoi_texture_node,
+    'ShaderNodeTexWave': convert_wave_texture_node,
+    'ShaderNodeWavelength': convert_wavelength_node,
+}
+
+
 def convert_texture_node(ctx, socket):
-    texture_converters = {
-        'ShaderNodeBlackbody': convert_blackbody_node,
-        'ShaderNodeTexBrick': convert_brick_texture_node,
-        'ShaderNodeClamp': convert_clamp_node,
-        'ShaderNodeTexCoord': convert_coord_texture_node,
-        'ShaderNodeMapping': convert_coord_texture_node,
-        'ShaderNodeFresnel': convert_fresnel_node,
-        "ShaderNodeTexImage": convert_image_texture_node,
-        'ShaderNodeLayerWeight': convert_layer_weight_node,
-        'ShaderNodeMixRGB': convert_mix_rgb_node,
-        'ShaderNodeTexMusgrave': convert_musgrave_texture_node,
-        'ShaderNodeTexNoise': convert_noise_texture_node,
-        'ShaderNodeRGB': convert_rgb_node,
-        'ShaderNodeTexVoronoi': convert_voronoi_texture_node,
-        'ShaderNodeTexWave': convert_wave_texture_node,
-        'ShaderNodeWavelength': convert_wavelength_node,
-    }
 
     params = None
     if socket.is_linked:
-        s = ctx.follow_link(socket)
-        node = s.links[0].from_node
-        from_socket = s.links[0].from_socket
-
-        if node.bl_idname in texture_converters:
-            ctx.info(f"Converting a '{node.bl_idname}' Blender shader node.")
-            params = texture_converters[node.bl_idname](ctx, from_socket)
-            if params and isinstance(params, Iterable) and 'type' in params:
-                ctx.info(f"  Created a '{params['type']}' texture.")
-        else:
+        link = ctx.input_link(socket)
+        node = link.from_node
+        from_socket = link.from_socket
+
+        # the same texture node often feeds several sockets, so only convert each output once
+        key = (node.id_data.as_pointer(), node.name, from_socket.identifier)
+        if key in ctx.texture_node_cache:
+            return ctx.texture_node_cache[key]
+
+        converter = TEXTURE_CONVERTERS.get(node.bl_idname)
+        if converter is None:
             raise NotImplementedError(
                 f"Shader node type {node.bl_idname} is not supported")
+
+        ctx.info(f"Converting a '{node.bl_idname}' Blender shader node.")
+        params = converter(ctx, from_socket)
+        if params and isinstance(params, Iterable) and 'type' in params:
+            ctx.info(f"  Created a '{params['type']}' texture.")
+        ctx.texture_node_cache[key] = params
     else:
         if socket.name == 'Roughness':  # roughness values in blender are remapped with a square root
             params = pow(socket.default_value, 2)
@@ -545,27 +599,28 @@ def convert_background(ctx, world):
             if not output_node.inputs['Surface'].is_linked:
                 return 0
 
-            surface_node = ctx.follow_link(
-                output_node.inputs['Surface']).links[0].from_node
-            if 'Strength' not in surface_node.inputs:
+            surface_node = ctx.input_link(
+                output_node.inputs['Surface']).from_node
+            strength_input = surface_node.inputs.get('Strength')
+            if strength_input is None:
                 raise NotImplementedError(
                     "Expecting a material with a 'Strength' parameter for a background")
 
-            if surface_node.inputs['Strength'].is_linked:
+            if strength_input.is_linked:
                 raise NotImplementedError(
                     "Only default emitter 'Strength' value is supported")
 
-            strength = surface_node.inputs['Strength'].default_value
+            strength = strength_input.default_value
             if strength == 0:  # Don't add an emitter if it emits nothing
                 ctx.info('Ignoring envmap with zero strength.')
                 return 0
 
-            if surface_node.bl_idname in ['ShaderNodeBackground', 'ShaderNodeEmission']:
+            if surface_node.bl_idname in {'ShaderNodeBackground', 'ShaderNodeEmission'}:
                 socket = surface_node.inputs['Color']
                 if socket.is_linked:
-                    socket = ctx.follow_link(socket)
-                    color_node = socket.links[0].from_node
-                    if color_node.bl_idname == 'ShaderNodeTexEnvironment':
+                    color_node = ctx.input_link(socket).from_node
+                    color_type = color_node.bl_idname
+                    if color_type == 'ShaderNodeTexEnvironment':
                         params = {
                             'type': 'envmap',
                             'filename': export_texture(ctx, color_node.image),
@@ -576,17 +631,17 @@ def convert_background(ctx, world):
                             ctx, params, color_node.inputs['Vector'])
 
                         return params
-                    elif color_node.bl_idname == 'ShaderNodeRGB':
+                    elif color_type == 'ShaderNodeRGB':
                         color = color_node.color
                     else:
                         raise NotImplementedError(
-                            f"Node type {color_node.bl_idname} is not supported. Consider using an environment texture or RGB node instead")
+                            f"Node type {color_type} is not supported. Consider using an environment texture or RGB node instead")
                 else:
                     color = socket.default_value
 
                 # Not an envmap
-                radiance = [x * strength for x in color[:3]]
-                if np.sum(radiance) == 0:
+                radiance = [c * strength for c in color[:3]]
+                if not any(radiance):
                     ctx.info("Ignoring background emitter with zero emission.")
                     return 0
                 return ctx.color(radiance)
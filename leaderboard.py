@@ -4,9 +4,11 @@ from datetime import datetime as dt
 import subprocess
 import pickle
 import re
-import math
 import sys
 
+# matches the "<title> <num> / <denom>" lines of the two ray statistics darts reports
+STATS_PATTERN = re.compile(r"(Total intersection tests per ray|Nodes visited per ray).*\s+\b(\d+)\b.*\s+\b(\d+)\b")
+
 def find_executable():
     '''
 		Find the path to the DARTS executable.
@@ -15,25 +17,14 @@ def find_executable():
 	'''
 
     root = os.getcwd()
-    darts = ""
-    if (os.name == 'nt'): #windows OS
-        if os.path.exists(os.path.join(root, "build", "Release", "darts.exe")):
-            darts = os.path.join(root, "build", "Release", "darts.exe")
-        elif os.path.exists(os.path.join(root, "build", "darts.exe")):
-            darts = os.path.join(root, "build", "darts.exe")
-        else:
-            print("Missing build dir\n")
-            return None, None
-    else: # mac/linux
-        if os.path.exists(os.path.join(root, "build", "Release", "darts")):
-            darts = os.path.join(root, "build", "Release", "darts")
-        elif os.path.exists(os.path.join(root, "build", "darts")):
-            darts = os.path.join(root, "build", "darts")
-        else:
-            print("Missing build dir\n")
-            return None, None
-    
-    return darts, root
+    darts = "darts.exe" if os.name == 'nt' else "darts"
+    for config_dir in ("Release", ""):
+        path = os.path.join(root, "build", config_dir, darts)
+        if os.path.exists(path):
+            return path, root
+
+    print("Missing build dir\n")
+    return None, None
 
 def render_image(exe_path, root_path):
     '''
@@ -47,32 +38,26 @@ def render_image(exe_path, root_path):
     start_time = dt.now()
     
     print("Starting render.... this may take a bit... ")
-    proc = subprocess.Popen([exe_path, scene_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out = proc.communicate()
+    # scan the output line by line as it is produced, instead of buffering all of it
+    proc = subprocess.Popen([exe_path, scene_file], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            encoding='utf-8')
+    stats = {}
+    for line in proc.stdout:
+        match = STATS_PATTERN.search(line)
+        if match:
+            stats.setdefault(match.group(1), float(match.group(2)) / float(match.group(3)))
+    proc.wait()
     print("Finished rendering image")
 
-    stats_loc = out[0].decode('u8').find("Statistics:")
-
-    intersections = out[0].decode('u8').find("Total intersection tests per ray")
-    nodes = out[0].decode('u8').find("Nodes visited per ray")
-
-    tri_str = out[0].decode('u8')[intersections::]
-    tri_str_nodes = out[0].decode('u8')[nodes::]
-
-    intersection_pattern = re.compile(r".*\s+\b(\d+)\b.*\s+\b(\d+)\b")
-
-    match = intersection_pattern.match(tri_str.strip())
-    match_nodes = intersection_pattern.match(tri_str_nodes.strip())
-
-    files = [os.path.join(scene_dir, fname) for fname in os.listdir(scene_dir) if fname.startswith(scene_name) and fname.endswith(".png")]
-
-    files.sort(key=lambda x: os.path.getmtime(x))
+    # a single directory scan; DirEntry.stat() only needs one syscall per image
+    with os.scandir(scene_dir) as entries:
+        files = [entry for entry in entries if entry.name.startswith(scene_name) and entry.name.endswith(".png")]
 
-    most_recent_img = files[-1]
+    most_recent_img = max(files, key=lambda entry: entry.stat().st_mtime).path
     end_time = dt.now()
 
-    intersections = float(match.group(1)) / float(match.group(2))
-    nodes = float(match_nodes.group(1)) / float(match_nodes.group(2))
+    intersections = stats["Total intersection tests per ray"]
+    nodes = stats["Nodes visited per ray"]
 
     return most_recent_img, intersections, nodes, start_time, end_time
 
@@ -104,9 +89,9 @@ def main():
 
     print("Image path:", img_path)
     print()
-    print("Total intersection tests per ray:", math.floor(intersections*100.0)/100.0)
-    print("Nodes visited per ray:", math.floor(nodes*100.0)/100.0)
-    print("Figure of merit:", math.floor(nodes*intersections*100.0)/100.0)
+    print(f"Total intersection tests per ray: {intersections:.2f}")
+    print(f"Nodes visited per ray: {nodes:.2f}")
+    print(f"Figure of merit: {nodes*intersections:.2f}")
     print()
 
     create_hash(img_path, intersections, nodes, publicize_results, time_start, time_end)